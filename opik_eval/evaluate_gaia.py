@@ -7,12 +7,14 @@ against the GAIA Level 1 dataset, while maintaining individual question tracing
 and saving outputs to a JSONL file.
 """
 
-import json
+import re
 import uuid
 import logging
 import sys
 import time
+import threading
 from pathlib import Path
+import orjson
 from opik import Opik, configure
 from opik.evaluation import evaluate
 from opik.evaluation.metrics import base_metric, score_result
@@ -20,7 +22,7 @@ from opik.evaluation.metrics import base_metric, score_result
 # Add src to path for multi-agent system imports
 sys.path.append(str(Path(__file__).parent.parent / "src"))
 
-from multi_agent_system import create_multi_agent_graph
+from multi_agent_system import create_multi_agent_graph, release_python_repl
 from main import load_baseline_prompts, make_agent_configs, parse_agent_output
 from scorer import question_scorer
 
@@ -28,6 +30,19 @@ from scorer import question_scorer
 graph = None
 opik_tracer = None
 
+# Number of dataset items evaluated concurrently by Opik. This is safe because every graph.invoke gets its own
+# thread_id, python_repl_tool keeps a separate REPL per thread_id and serializes execution, and the other tools only
+# share lock-protected caches. Any new tool that shares process state must be isolated the same way.
+TASK_THREADS = 8
+
+# Long-lived handle for the responses JSONL file, shared by all task threads
+OUTPUT_FILE = "/home/joe/python-proj/hf-ai-agents-course/opik_eval/gaia_evaluation_responses.jsonl"
+responses_file = None
+responses_lock = threading.Lock()
+
+# Matches the JSON-encoded final_answer string in a task output
+_FINAL_ANSWER_RE = re.compile(r'"final_answer"\s*:\s*("(?:[^"\\]|\\.)*")')
+
 
 
 
@@ -41,14 +56,14 @@ def evaluate_question(dataset_item):
     Returns:
         Dictionary with model_answer, expected_answer, question for scoring
     """
-    global graph, opik_tracer
+    global graph, opik_tracer, responses_file
     
     # Extract question and file info
     question = dataset_item["Question"]
     file_name = dataset_item.get("file_name", "")
     
     # Log processing like main.py
-    logging.getLogger(__name__).info(f"Processing question: {question}")
+    logging.getLogger(__name__).info("Processing question: %s", question)
     
     # Construct file path (exactly like main.py)
     if file_name != "":
@@ -66,14 +81,14 @@ def evaluate_question(dataset_item):
         "recursion_limit": 100
     }
     
-    # Invoke graph
-    result = graph.invoke({"question": question, "file": file_path}, config=config)
+    # Invoke graph, dropping the question's Python REPL once the run is over
+    try:
+        result = graph.invoke({"question": question, "file": file_path}, config=config)
+    finally:
+        release_python_repl(thread_id)
     
     model_answer, reasoning_trace = parse_agent_output(result)
     
-    # Flush traces
-    opik_tracer.flush()
-    
     # Write response to JSONL file immediately (exactly like main.py format)
     response = {
         "task_id": dataset_item["task_id"], 
@@ -83,19 +98,18 @@ def evaluate_question(dataset_item):
     }
     
     # Write this single response to the JSONL file immediately
-    output_file = "/home/joe/python-proj/hf-ai-agents-course/opik_eval/gaia_evaluation_responses.jsonl"
-    with open(output_file, "a") as f:
-        json.dump(response, f)
-        f.write("\n")
+    with responses_lock:
+        responses_file.write(orjson.dumps(response) + b"\n")
+        responses_file.flush()
     
     # Log completion like main.py
-    logging.getLogger(__name__).info(f"Completed question: {question}")
+    logging.getLogger(__name__).info("Completed question: %s", question)
     
     # Create the complete JSON output for Opik to record
-    complete_json_output = json.dumps({
+    complete_json_output = orjson.dumps({
         "final_answer": model_answer,
         "reasoning_trace": reasoning_trace
-    })
+    }).decode()
     
     # Return for scoring (include complete JSON output and reference)
     return {
@@ -125,13 +139,18 @@ class CustomMetric(base_metric.BaseMetric):
             ScoreResult with the evaluation score
         """
         try:
-            # Extract final_answer from the JSON output
-            try:
-                output_json = json.loads(output)
-                actual_answer = output_json.get("final_answer", "")
-            except (json.JSONDecodeError, TypeError):
-                # If JSON parsing fails, use the output as-is
-                actual_answer = output
+            # Extract final_answer from the JSON output, decoding only the
+            # final_answer string when it can be located directly
+            match = _FINAL_ANSWER_RE.search(output) if isinstance(output, str) else None
+            if match:
+                actual_answer = orjson.loads(match.group(1))
+            else:
+                try:
+                    output_json = orjson.loads(output)
+                    actual_answer = output_json.get("final_answer", "")
+                except orjson.JSONDecodeError:
+                    # If JSON parsing fails, use the output as-is
+                    actual_answer = output
             
             # Use the question_scorer to evaluate the answer
             is_correct = question_scorer(actual_answer, reference)
@@ -161,7 +180,7 @@ def main():
     """
     Main function to run the evaluation.
     """
-    global graph, opik_tracer, responses
+    global graph, opik_tracer, responses_file
     
     # Configure Opik
     configure(use_local=True)
@@ -175,15 +194,13 @@ def main():
         client = Opik(project_name="gaia-evaluation-project")
         dataset = client.get_dataset(name="GAIA Level 1 Dataset")
         
-        # Check if dataset is empty
-        if not dataset.get_items():
+        # Check if dataset is empty (fetch a single item rather than the whole dataset)
+        if not dataset.get_items(nb_samples=1):
             logger.error("Dataset is empty")
             return
         
-        # Clear the output file to start fresh
-        output_file = "/home/joe/python-proj/hf-ai-agents-course/opik_eval/gaia_evaluation_responses.jsonl"
-        with open(output_file, "w") as f:
-            pass  # Create empty file
+        # Clear the output file to start fresh and keep it open for the whole run
+        responses_file = open(OUTPUT_FILE, "wb")
         
         # Load prompts and create graph (exactly like main.py)
         prompts = load_baseline_prompts()
@@ -206,18 +223,24 @@ def main():
                 "reference": "Final answer",  # Map dataset's "Final answer" to metric's "reference" parameter
                 "output": "output"  # Map task output's "output" key to metric's "output" parameter
             },
-            task_threads=1,
+            task_threads=TASK_THREADS,
             verbose=1
         )
         
+        # Flush traces once all questions have been evaluated
+        opik_tracer.flush()
+        
         # Log results (exactly like main.py)
         logger.info("Evaluation finished successfully")
-        output_file = "/home/joe/python-proj/hf-ai-agents-course/opik_eval/gaia_evaluation_responses.jsonl"
-        logger.info(f"Results saved to: {output_file}")
+        logger.info("Results saved to: %s", OUTPUT_FILE)
         
     except Exception as e:
-        logger.error(f"Evaluation failed: {e}")
+        logger.error("Evaluation failed: %s", e)
         raise
+    finally:
+        if responses_file is not None:
+            responses_file.close()
+            responses_file = None
 
 
 if __name__ == "__main__":
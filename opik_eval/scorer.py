@@ -5,6 +5,9 @@ import warnings
 
 import numpy as np
 
+_WHITESPACE_RE = re.compile(r"\s")
+_PUNCT_TRANSLATOR = str.maketrans("", "", string.punctuation)
+
 
 def normalize_number_str(number_str: str) -> float:
     # we replace these common units and commas to allow
@@ -94,11 +97,10 @@ def normalize_str(input_str, remove_punct=True) -> str:
     - str, the normalized string
     """
     # Remove all white spaces. Required e.g for seagull vs. sea gull
-    no_spaces = re.sub(r"\s", "", input_str)
+    no_spaces = _WHITESPACE_RE.sub("", input_str)
 
     # Remove punctuation, if specified.
     if remove_punct:
-        translator = str.maketrans("", "", string.punctuation)
-        return no_spaces.lower().translate(translator)
+        return no_spaces.lower().translate(_PUNCT_TRANSLATOR)
     else:
         return no_spaces.lower()
@@ -1,29 +1,57 @@
-import json
+import mmap
+import os
+import orjson
 
 
 
 
 
-def read_jsonl_file(file_path):
+def read_jsonl_file(file_path, predicate=None):
     """
     Read a JSONL file line by line and yield each parsed JSON object.
     
     Args:
         file_path (str): Path to the JSONL file
+        predicate (callable): Optional check on each raw line (bytes).
+                              Lines it rejects are skipped without being parsed.
         
     Yields:
         dict: Parsed JSON object from each line
     """
-    with open(file_path, "r") as f:
-        for line in f:
-            line = line.strip()  # Remove whitespace and newlines
-            if line:  # Skip empty lines
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:  # mmap cannot map an empty file
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0
+            size = len(mm)
+            while start < size:
+                end = mm.find(b"\n", start)
+                if end == -1:  # Last line without a trailing newline
+                    end = size
+                line = mm[start:end]
+                start = end + 1
+                if not line or line.isspace():  # Skip empty lines
+                    continue
+                if predicate is not None and not predicate(line):
+                    continue
                 try:
-                    yield json.loads(line)
-                except json.JSONDecodeError as e:
+                    yield orjson.loads(line)
+                except orjson.JSONDecodeError as e:
                     print(f"Error parsing JSON line: {e}")
                     continue
 
+def is_level_1_line(line):
+    """
+    Cheaply check whether a raw JSONL line may hold a Level 1 question, without parsing it.
+
+    Args:
+        line (bytes): Raw line from the JSONL file
+
+    Returns:
+        bool: False if the line cannot be a Level 1 question
+    """
+    return b'"Level": 1' in line or b'"Level":1' in line
+
 def write_jsonl_file(data_list, output_file_path):
     """
     Write a list of data to a JSONL file, with each element as a separate line.
@@ -32,16 +60,15 @@ def write_jsonl_file(data_list, output_file_path):
         data_list (list): List of data to write (can be dicts, strings, etc.)
         output_file_path (str): Path to the output JSONL file
     """
-    with open(output_file_path, "w") as f:
+    with open(output_file_path, "wb") as f:
         for item in data_list:
-            json_line = json.dumps(item)
-            f.write(json_line + "\n")
+            f.write(orjson.dumps(item) + b"\n")
 
 
 # Example usage:
 if __name__ == "__main__":
     jsonl_file_path = "/home/joe/python-proj/hf-agents-course/studio/metadata.jsonl"
     
-    items = [ item for item in read_jsonl_file(jsonl_file_path) if item["Level"] == 1 ]
+    items = [ item for item in read_jsonl_file(jsonl_file_path, predicate=is_level_1_line) if item["Level"] == 1 ]
 
     write_jsonl_file(items, "/home/joe/python-proj/hf-agents-course/studio/gaia_lvl1.jsonl")
\ No newline at end of file
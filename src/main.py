@@ -1,25 +1,59 @@
-import json
-import time
+import asyncio
+import atexit
+import functools
+import orjson
 import os
+import random
 import logging
-from multi_agent_system import create_multi_agent_graph, AgentConfig
-from typing import Literal
+import logging.handlers
+import queue
+import httpx
+from openai import DefaultAsyncHttpxClient, RateLimitError
+from multi_agent_system import create_multi_agent_graph, release_python_repl, AgentConfig
+from typing import Literal, Callable, Mapping
 import sys
+import types
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
-# Configure logging at the entry point
+# Configure logging at the entry point. Records are formatted and queued by the
+# calling thread, and a background listener writes them to the file and console.
+log_queue = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(
+    log_queue,
+    logging.FileHandler('app.log'),
+    logging.StreamHandler()
+)
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('app.log'),
-        logging.StreamHandler()
-    ]
+    handlers=[logging.handlers.QueueHandler(log_queue)]
 )
+log_listener.start()
+atexit.register(log_listener.stop)
 
 # Create logger for main module
 logger = logging.getLogger(__name__)
 
+# Opik tracing is opt-in (set USE_OPIK=1); without it Opik is never imported or configured
+USE_OPIK = os.environ.get("USE_OPIK", "").lower() in ("1", "true", "yes")
+
+# Number of completed questions between Opik trace flushes
+OPIK_FLUSH_INTERVAL = 10
+
+# Maximum number of questions processed concurrently (override with GAIA_MAX_CONCURRENCY)
+MAX_CONCURRENCY = int(os.environ.get("GAIA_MAX_CONCURRENCY", "8"))
+
+# Baseline prompts directory: prompts/baseline under the project root
+BASELINE_PROMPTS_DIR = Path(__file__).resolve().parent.parent / "prompts" / "baseline"
+
+# Seconds a single question may run before it is cancelled (override with GAIA_QUESTION_TIMEOUT)
+QUESTION_TIMEOUT = float(os.environ.get("GAIA_QUESTION_TIMEOUT", "600"))
+
+# Attempts per question before a rate limit error is given up on
+MAX_RATE_LIMIT_ATTEMPTS = 6
+
 
 def load_prompt_from_file(file_path: str) -> str:
     """
@@ -31,74 +65,88 @@ def load_prompt_from_file(file_path: str) -> str:
     Returns:
         str: Content of the prompt file
     """
+    logger.debug("Loading prompt from: %s", file_path)
     try:
         with open(file_path, "r", encoding="utf-8") as f:
             content = f.read().strip()
-            logger.debug(f"Successfully loaded prompt from: {file_path}")
+            logger.debug("Successfully loaded prompt from: %s", file_path)
             return content
     except FileNotFoundError:
-        logger.error(f"Prompt file not found: {file_path}")
+        logger.error("Prompt file not found: %s", file_path)
         raise FileNotFoundError(f"Prompt file not found: {file_path}")
     except Exception as e:
-        logger.error(f"Error reading prompt file {file_path}: {str(e)}")
+        logger.error("Error reading prompt file %s: %s", file_path, e)
         raise Exception(f"Error reading prompt file {file_path}: {str(e)}")
 
 
-def load_baseline_prompts(prompts_dir: str = None) -> dict:
+@functools.lru_cache(maxsize=4)
+def load_baseline_prompts(prompts_dir: str = None) -> Mapping[str, str]:
     """
     Load all baseline prompts from the prompts/baseline directory.
+    The prompt files are read concurrently and the result is cached per directory.
+    The cached prompts are shared between callers, so they are returned as a read-only mapping.
     
     Args:
         prompts_dir (str): Optional path to the prompts/baseline directory.
-                          If None, will automatically find the correct path.
+                          If None, BASELINE_PROMPTS_DIR is used.
         
     Returns:
-        dict[str, AgentPrompts]: Dictionary containing all agent prompts
+        Mapping[str, str]: Read-only mapping of agent name to system prompt
     """
-    if prompts_dir is None:
-        # Try to find the baseline prompts directory relative to this script
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        # Go up one level from src/ to the project root, then into prompts/baseline
-        prompts_dir = os.path.join(script_dir, "..", "prompts", "baseline")
-        prompts_dir = os.path.normpath(prompts_dir)
+    prompts_dir = BASELINE_PROMPTS_DIR if prompts_dir is None else Path(prompts_dir)
     
-    logger.info(f"Loading prompts from directory: {prompts_dir}")
+    logger.info("Loading prompts from directory: %s", prompts_dir)
     
     prompt_files = {
         "executor": "executor_system_prompt.txt",
         "guard": "guard_system_prompt.txt",
         }
     
-    prompts = {}
-    for agent_name, filename in prompt_files.items():
-        file_path = os.path.join(prompts_dir, filename)
-        logger.debug(f"Loading prompt for {agent_name} from: {file_path}")
-        prompts[agent_name] = load_prompt_from_file(file_path)
+    file_paths = [prompts_dir / filename for filename in prompt_files.values()]
+    with ThreadPoolExecutor(max_workers=len(file_paths)) as executor:
+        prompts = dict(zip(prompt_files.keys(), executor.map(load_prompt_from_file, file_paths)))
     
-    logger.info(f"Successfully loaded {len(prompts)} prompts")
-    return prompts
+    logger.info("Successfully loaded %d prompts", len(prompts))
+    return types.MappingProxyType(prompts)
 
 
-def read_jsonl_file(file_path:str) -> dict:
+def read_jsonl_file(file_path:str, predicate:Callable[[bytes], bool] = None) -> dict:
     """
     Read a JSONL file line by line and yield each parsed JSON object.
     
     Args:
         file_path (str): Path to the JSONL file
+        predicate (Callable[[bytes], bool]): Optional check on each raw line.
+                                             Lines it rejects are skipped without being parsed.
         
     Yields:
         dict: Parsed JSON object from each line
     """
-    logger.debug(f"Reading JSONL file: {file_path}")
-    with open(file_path, "r") as f:
+    logger.debug("Reading JSONL file: %s", file_path)
+    with open(file_path, "rb", buffering=64 * 1024) as f:
         for line in f:
-            line = line.strip()  # Remove whitespace and newlines
-            if line:  # Skip empty lines
-                try:
-                    yield json.loads(line)
-                except json.JSONDecodeError as e:
-                    logger.error(f"Error parsing JSON line: {e}")
-                    continue
+            if line.isspace():  # Skip empty lines
+                continue
+            if predicate is not None and not predicate(line):
+                continue
+            try:
+                yield orjson.loads(line)
+            except orjson.JSONDecodeError as e:
+                logger.error("Error parsing JSON line: %s", e)
+                continue
+
+
+def is_level_1_line(line: bytes) -> bool:
+    """
+    Cheaply check whether a raw JSONL line may hold a Level 1 question, without parsing it.
+
+    Args:
+        line (bytes): Raw line from the JSONL file
+
+    Returns:
+        bool: False if the line cannot be a Level 1 question
+    """
+    return b'"Level": 1' in line or b'"Level":1' in line
 
 
 def write_jsonl_file(data_list:list[dict], output_file_path:str) -> None:
@@ -112,35 +160,101 @@ def write_jsonl_file(data_list:list[dict], output_file_path:str) -> None:
     Returns:
         None
     """
-    logger.info(f"Writing {len(data_list)} items to: {output_file_path}")
-    with open(output_file_path, "w") as f:
+    logger.info("Writing %d items to: %s", len(data_list), output_file_path)
+    with open(output_file_path, "wb") as f:
         for item in data_list:
-            json_line = json.dumps(item)
-            f.write(json_line + "\n")
-    logger.info(f"Successfully wrote {len(data_list)} items to: {output_file_path}")
+            f.write(orjson.dumps(item) + b"\n")
+    logger.info("Successfully wrote %d items to: %s", len(data_list), output_file_path)
 
 
 
-def make_agent_configs(prompts: dict) -> dict[str, AgentConfig]:
+def make_agent_configs(prompts: Mapping[str, str], http_async_client: httpx.AsyncClient = None) -> dict[str, AgentConfig]:
     """
     Make a dictionary of agent configs from the prompts.
 
     Args:
-        prompts (dict): Dictionary of prompts for each agent
+        prompts (Mapping[str, str]): Prompts for each agent
+        http_async_client (httpx.AsyncClient): Optional async HTTP client shared by all agents
 
     Returns:
         dict[str, AgentConfig]: Dictionary of agent configs
     """
     logger.info("Creating agent configurations...")
     configs = {
-        "executor": AgentConfig(name="executor", provider="openai", model="o4-mini", temperature=1.0, system_prompt=prompts["executor"], output_schema={"final_answer": str, "reasoning_trace": str}),
-        "guard": AgentConfig(name="guard", provider="openai", model="o4-mini", temperature=1.0, system_prompt=prompts["guard"]),
-        "web_browser": AgentConfig(name="web_browser", provider="openai", model="o4-mini", temperature=1.0, system_prompt=prompts["web_browser"]),
+        "executor": AgentConfig(name="executor", provider="openai", model="o4-mini", temperature=1.0, system_prompt=prompts["executor"], output_schema={"final_answer": str, "reasoning_trace": str}, http_async_client=http_async_client),
+        "guard": AgentConfig(name="guard", provider="openai", model="o4-mini", temperature=1.0, system_prompt=prompts["guard"], http_async_client=http_async_client),
+        "web_browser": AgentConfig(name="web_browser", provider="openai", model="o4-mini", temperature=1.0, system_prompt=prompts["web_browser"], http_async_client=http_async_client),
     }
-    logger.info(f"Created {len(configs)} agent configurations")
+    logger.info("Created %d agent configurations", len(configs))
     return configs
 
 
+def extract_json_objects(text: str):
+    """
+    Scan a string once, left to right, and yield every maximal balanced JSON object it contains.
+    Braces inside JSON string literals are ignored. An opening brace that is never closed does not
+    stop the scan, so balanced objects after or inside it are still found.
+
+    Args:
+        text (str): The text to scan
+
+    Yields:
+        str: The substring of each balanced {...} object that is not nested in another one, in order of appearance
+    """
+    open_braces = []
+    spans = []
+    in_string = False
+    escaped = False
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == "{":
+            open_braces.append(index)
+        elif not open_braces:
+            # Quotes and closing braces outside any object are plain text
+            continue
+        elif char == '"':
+            in_string = True
+        elif char == "}":
+            start = open_braces.pop()
+            # Drop the spans nested in this one, keeping only the outermost balanced objects
+            while spans and spans[-1][0] > start:
+                spans.pop()
+            spans.append((start, index + 1))
+    for start, end in spans:
+        yield text[start:end]
+
+
+def find_answer_object(value):
+    """
+    Find the first dict containing "final_answer" in a parsed JSON value, searching nested dicts and lists.
+
+    Args:
+        value: The parsed JSON value
+
+    Returns:
+        dict: The first dict with a "final_answer" key, or None if there is none
+    """
+    if isinstance(value, dict):
+        if "final_answer" in value:
+            return value
+        children = value.values()
+    elif isinstance(value, list):
+        children = value
+    else:
+        return None
+    for child in children:
+        found = find_answer_object(child)
+        if found is not None:
+            return found
+    return None
+
+
 def parse_agent_output(result: dict) -> dict:
     """
     Parse the output of the agent.
@@ -166,36 +280,28 @@ def parse_agent_output(result: dict) -> dict:
         
         try:
             # First try to parse the message content directly as JSON
-            output_json = json.loads(last_message_content)
-            if "final_answer" in output_json and "reasoning_trace" in output_json:
+            output_json = orjson.loads(last_message_content)
+            if isinstance(output_json, dict) and "final_answer" in output_json and "reasoning_trace" in output_json:
                 model_answer = output_json["final_answer"]
                 reasoning_trace = output_json["reasoning_trace"]
             else:
                 raise ValueError("JSON missing required fields")
-        except (ValueError, KeyError, json.JSONDecodeError) as e:
-            logger.warning(f"Failed to parse JSON directly: {e}")
-            # Fallback: try to extract JSON from the response
-            import re
-            
-            # Look for JSON in the response with more flexible pattern
-            json_patterns = [
-                r'\{[^{}]*"final_answer"[^{}]*"reasoning_trace"[^{}]*\}',
-                r'\{[^{}]*"final_answer"[^{}]*\}',
-                r'\{[^{}]*"reasoning_trace"[^{}]*"final_answer"[^{}]*\}'
-            ]
-            
-            for pattern in json_patterns:
-                json_match = re.search(pattern, last_message_content, re.DOTALL)
-                if json_match:
-                    try:
-                        fallback_json = json.loads(json_match.group())
-                        model_answer = fallback_json.get("final_answer", "")
-                        reasoning_trace = fallback_json.get("reasoning_trace", "")
-                        if model_answer and reasoning_trace:
-                            logger.info("Successfully extracted JSON using fallback pattern")
-                            break
-                    except json.JSONDecodeError:
-                        continue
+        except (ValueError, KeyError, orjson.JSONDecodeError) as e:
+            logger.warning("Failed to parse JSON directly: %s", e)
+            # Fallback: try to extract a JSON object embedded in the response
+            for json_candidate in extract_json_objects(last_message_content):
+                try:
+                    fallback_json = orjson.loads(json_candidate)
+                except orjson.JSONDecodeError:
+                    continue
+                answer_json = find_answer_object(fallback_json)
+                if answer_json is None:
+                    continue
+                model_answer = answer_json.get("final_answer", "")
+                reasoning_trace = answer_json.get("reasoning_trace", "")
+                if model_answer and reasoning_trace:
+                    logger.info("Successfully extracted JSON from the response")
+                    break
             
             # If still no valid JSON found, use the raw response
             if not model_answer:
@@ -212,71 +318,192 @@ def parse_agent_output(result: dict) -> dict:
     return model_answer, reasoning_trace
 
 
+async def ainvoke_with_backoff(graph, inputs: dict, config: dict) -> dict:
+    """
+    Invoke the graph, retrying with exponential backoff and jitter when the LLM provider rate limits the run.
+
+    Args:
+        graph: The compiled multi-agent graph
+        inputs (dict): The graph input state
+        config (dict): The run configuration
+
+    Returns:
+        dict: The final graph state
+    """
+    for attempt in range(MAX_RATE_LIMIT_ATTEMPTS):
+        try:
+            return await graph.ainvoke(inputs, config=config)
+        except RateLimitError:
+            if attempt == MAX_RATE_LIMIT_ATTEMPTS - 1:
+                raise
+            delay = min(2 ** attempt, 60) + random.random()
+            logger.warning("Rate limited, retrying in %.1f seconds (attempt %d/%d)", delay, attempt + 1, MAX_RATE_LIMIT_ATTEMPTS)
+            await asyncio.sleep(delay)
+
+
+async def process_question(graph, opik_tracer, item: dict, semaphore: asyncio.Semaphore, output_file) -> bool:
+    """
+    Run the multi-agent graph on a single question and append its response to the output file.
+    A run that exceeds QUESTION_TIMEOUT is cancelled and recorded with a "TIMEOUT" answer.
+    Any other failure is logged and recorded with an "ERROR" answer, so it never cancels other questions.
+
+    Args:
+        graph: The compiled multi-agent graph
+        opik_tracer (OpikTracer): The tracer to attach to the graph run, or None when tracing is disabled
+        item (dict): The question item read from the JSONL file
+        semaphore (asyncio.Semaphore): Bounds the number of concurrent graph runs
+        output_file: Open, unbuffered binary JSONL file the response is written to
+
+    Returns:
+        bool: True if the agent answered the question, False if it timed out or failed
+    """
+    answered = False
+    async with semaphore:
+        logger.info("Processing question: %s", item['Question'])
+        # Generate unique thread_id for each iteration
+        thread_id = str(uuid.uuid4())
+        # Configure with unique thread_id
+        config = {
+            "configurable": {"thread_id": thread_id},
+            "recursion_limit": 100
+        }
+        if opik_tracer is not None:
+            config["callbacks"] = [opik_tracer]
+
+        if item["file_name"] != "":
+            file_path = f"/home/joe/datum/gaia_level1/{item['file_name']}"
+        else:
+            file_path = ""
+        try:
+            async with asyncio.timeout(QUESTION_TIMEOUT):
+                result = await ainvoke_with_backoff(graph, {"question": item["Question"], "file": file_path}, config)
+            model_answer, reasoning_trace = parse_agent_output(result)
+            answered = True
+        except TimeoutError:
+            logger.error("Question %s timed out after %s seconds", item['task_id'], QUESTION_TIMEOUT)
+            model_answer = "TIMEOUT"
+            reasoning_trace = f"The agent did not finish within {QUESTION_TIMEOUT} seconds."
+        except Exception as e:
+            # Recursion limits, exhausted rate limit retries and tool errors still get a row, so the output covers every question
+            logger.error("Failed question %s: %s", item['task_id'], e)
+            model_answer = "ERROR"
+            reasoning_trace = f"The agent failed with {type(e).__name__}: {e}"
+        finally:
+            # The run is over (or cancelled), so its Python REPL namespace is no longer needed
+            release_python_repl(thread_id)
+
+    response = {"task_id": item["task_id"], "model_answer": model_answer, "reasoning_trace": reasoning_trace, "thread_id": thread_id}
+
+    # Write the response as soon as it is available so a crash keeps completed answers.
+    # The write does not await, so concurrent questions cannot interleave lines.
+    output_file.write(orjson.dumps(response) + b"\n")
+
+    logger.info("Completed question: %s", item['Question'])
+    return answered
+
+
+def flush_traces(opik_tracer) -> None:
+    """
+    Flush pending Opik traces. A failed flush is logged rather than raised, so it never cancels the questions
+    still running in the task group.
+
+    Args:
+        opik_tracer (OpikTracer): The tracer to flush, or None when tracing is disabled
+    """
+    if opik_tracer is None:
+        return
+    try:
+        opik_tracer.flush()
+    except Exception as e:
+        logger.warning("Failed to flush Opik traces: %s", e)
+
+
+async def process_questions(graph, opik_tracer, items: list[dict], output_file, http_async_client: httpx.AsyncClient) -> int:
+    """
+    Run the multi-agent graph on all questions concurrently, streaming responses to the output file.
+
+    Args:
+        graph: The compiled multi-agent graph
+        opik_tracer (OpikTracer): The tracer to attach to the graph runs, or None when tracing is disabled
+        items (list[dict]): The question items to process
+        output_file: Open, unbuffered binary JSONL file the responses are written to
+        http_async_client (httpx.AsyncClient): The client shared by the agents. It is closed once all questions are
+            done, inside the same event loop its connections were opened in.
+
+    Returns:
+        int: The number of questions the agent answered. Every question gets a response row, including timeouts and errors.
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    questions_since_flush = 0
+
+    async def run_question(item: dict) -> bool:
+        nonlocal questions_since_flush
+        answered = await process_question(graph, opik_tracer, item, semaphore, output_file)
+        # Flush traces every OPIK_FLUSH_INTERVAL questions rather than after each one. The flush is a blocking network
+        # call, so it runs on a worker thread to keep the other questions moving
+        questions_since_flush += 1
+        if questions_since_flush >= OPIK_FLUSH_INTERVAL:
+            questions_since_flush = 0
+            await asyncio.to_thread(flush_traces, opik_tracer)
+        return answered
+
+    async with http_async_client, asyncio.TaskGroup() as task_group:
+        tasks = [task_group.create_task(run_question(item)) for item in items]
+
+    # Flush the traces of the remaining questions
+    await asyncio.to_thread(flush_traces, opik_tracer)
+    return sum(task.result() for task in tasks)
+
+
 def main() -> None:
     """
     Main function to run the application.
     """
+    opik_tracer = None
     try:
-        # Configure Opik for real-time flushing
-        from opik import configure
-        configure(use_local=True)
+        if USE_OPIK:
+            # Configure Opik for real-time flushing
+            from opik import configure
+            configure(use_local=True)
 
         logger.info("Application started")
         
         # Load baseline prompts
         logger.info("Loading baseline prompts...")
         prompts = load_baseline_prompts()
-        logger.info(f"Loaded {len(prompts)} prompts: {list(prompts.keys())}")
-        agent_configs = make_agent_configs(prompts)
+        logger.info("Loaded %d prompts: %s", len(prompts), list(prompts.keys()))
+        # One connection pool shared by every agent for the whole run, so concurrent
+        # questions reuse keep-alive connections instead of opening new ones
+        http_async_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(max_connections=4 * MAX_CONCURRENCY, max_keepalive_connections=4 * MAX_CONCURRENCY)
+        )
+        agent_configs = make_agent_configs(prompts, http_async_client)
         
         # Create the multi-agent graph using the factory function
         logger.info("Creating multi-agent graph...")
-        graph, opik_tracer = create_multi_agent_graph(agent_configs)
+        graph, opik_tracer = create_multi_agent_graph(agent_configs, enable_tracing=USE_OPIK)
         logger.info("Graph created successfully!")
         
         jsonl_file_path = "/home/joe/python-proj/hf-ai-agents-course/src/gaia_lvl1.jsonl"
         
-        responses = []
+        output_file_path = "/home/joe/python-proj/hf-ai-agents-course/src/gaia_lvl1_responses.jsonl"
+        
         logger.info("Starting to process JSONL file...")
-        for item in read_jsonl_file(jsonl_file_path):
-            if item["Level"] == 1:
-                logger.info(f"Processing question: {item["Question"]}")
-                # Generate unique thread_id for each iteration
-                thread_id = str(uuid.uuid4())
-                # Configure with unique thread_id
-                config = {
-                    "callbacks": [opik_tracer],
-                    "configurable": {"thread_id": thread_id},
-                    "recursion_limit": 100
-                }
-                
-                if item["file_name"] != "":
-                    file_path = f"/home/joe/datum/gaia_level1/{item['file_name']}"
-                else:
-                    file_path = ""
-                result = graph.invoke({"question": item["Question"], "file": file_path}, config=config)
-                
-                model_answer, reasoning_trace = parse_agent_output(result)
-                
-                response = {"task_id": item["task_id"], "model_answer": model_answer, "reasoning_trace": reasoning_trace, "thread_id": thread_id}
-
-                responses.append(response)
-                logger.info(f"Completed question: {item["Question"]}")
-                # Flush traces after each question
-                opik_tracer.flush()
-                time.sleep(5)
-
-        logger.info("Writing responses to output file...")
-        write_jsonl_file(responses, "/home/joe/python-proj/hf-ai-agents-course/src/gaia_lvl1_responses.jsonl")
+        items = [item for item in read_jsonl_file(jsonl_file_path, predicate=is_level_1_line) if item["Level"] == 1]
+        logger.info("Streaming responses to: %s", output_file_path)
+        with open(output_file_path, "wb", buffering=0) as output_file:
+            answered = asyncio.run(process_questions(graph, opik_tracer, items, output_file, http_async_client))
+        logger.info("Wrote %d responses (%d answered) to: %s", len(items), answered, output_file_path)
         logger.info("Application finished successfully")
         # Ensure all traces are logged before exiting
 
     except Exception as e:
         # Ensure all traces are logged before exiting
         try:
-            opik_tracer.flush()
+            if opik_tracer is not None:
+                opik_tracer.flush()
         finally:
-            logger.error(f"Application failed: {str(e)}")
+            logger.error("Application failed: %s", e)
             print(f"Application failed: {str(e)}")
             sys.exit(1)
 
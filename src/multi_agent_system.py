@@ -1,31 +1,47 @@
 from langgraph.graph import MessagesState, StateGraph, START, END
 from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, AIMessage
-from typing import Any, Literal, Optional, TypedDict, List, Annotated, Callable, Tuple
+from typing import Any, Literal, Optional, TypedDict, List, Annotated, Callable, Tuple, TYPE_CHECKING
+import ast
+import atexit
+import functools
+import hashlib
+from dataclasses import dataclass
 import operator
-import json
+import re
+import orjson
+import math
+import os
 import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+import httpx
+from openai import DefaultHttpxClient
 from langchain_openai import ChatOpenAI
 
 
-from opik.integrations.langchain import OpikTracer
-from opik import track
+# Opik is imported only when tracing is enabled, see create_multi_agent_graph
+if TYPE_CHECKING:
+    from opik.integrations.langchain import OpikTracer
 
 # Create logger for this module (uses root logger configuration from main.py)
 logger = logging.getLogger(__name__)
 
+# Expand subgraphs in the graph drawing sent to Opik (set OPIK_XRAY=1); off by default
+OPIK_XRAY = os.environ.get("OPIK_XRAY", "").lower() in ("1", "true", "yes")
+
 # Tools
 from langgraph.prebuilt import tools_condition, ToolNode
 from langchain_core.documents import Document
-from langchain_core.tools import tool
-from langchain_community.tools import WikipediaQueryRun
-from langchain_community.utilities.wikipedia import WikipediaAPIWrapper
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langchain_core.tools import StructuredTool, tool
 from langchain_tavily import TavilySearch
-from langchain_community.document_loaders import YoutubeLoader
-from langchain_community.document_loaders import UnstructuredExcelLoader, UnstructuredPowerPointLoader, UnstructuredPDFLoader
-from langchain_experimental.tools.python.tool import PythonREPLTool
-from langchain_community.document_loaders import TextLoader
-import pint
+import requests
+import wikipedia
 
+# All Wikipedia lookups are in English
+wikipedia.set_lang("en")
 
 
 ########################################################
@@ -39,133 +55,413 @@ class GraphState(MessagesState):
 ########################################################
 # < Configuration Types >
 ########################################################
-class AgentConfig():
+# eq=False keeps identity equality and hashing, since output_schema is an unhashable dict
+@dataclass(slots=True, frozen=True, eq=False)
+class AgentConfig:
     """Configuration for an agent."""
+    name: str
+    provider: str
+    model: str
+    temperature: float
+    system_prompt: str
+    output_schema: Optional[dict] = None
+    http_async_client: Optional[httpx.AsyncClient] = None
+
+
+########################################################
+# < Result Caches >
+########################################################
+# Tools run on worker threads, so updates to the bounded result caches are serialized
+_result_cache_lock = threading.Lock()
+
+
+def remember_result(cache: dict, key: Any, value: Any, max_size: int) -> None:
+    """Store a value in a bounded cache, evicting the oldest entry once the cache is full.
 
-    def __init__(self, name:str, provider:str, model:str, temperature:float, system_prompt:str, output_schema:dict=None):
-        self.name = name
-        self.provider = provider
-        self.model = model
-        self.temperature = temperature
-        self.output_schema = output_schema
-        self.system_prompt = system_prompt
+    Args:
+        cache (dict): The cache to store the value in
+        key (Any): The cache key
+        value (Any): The value to store
+        max_size (int): The maximum number of entries to keep
+    """
+    with _result_cache_lock:
+        if key not in cache and len(cache) >= max_size:
+            del cache[next(iter(cache))]
+        cache[key] = value
 
 
 ########################################################
 # < Information Gathering Tools >
 ########################################################
+# Pages longer than this are cut down to the sections most relevant to the query
+WIKI_MAX_CONTENT_CHARS = 100_000
+_WIKI_SECTION_RE = re.compile(r"^(={2,})[^=\n].*?\1[ \t]*$", re.MULTILINE)
+_WORD_RE = re.compile(r"\w{3,}")
+_RECIPIENTS_RE = re.compile("recipients", re.IGNORECASE)
+
+
+def select_relevant_sections(content: str, query: str, max_chars: int = WIKI_MAX_CONTENT_CHARS) -> str:
+    """Cut a long Wikipedia page down to its introduction and the sections most relevant to the query.
+
+    Sections are ranked by how often the query's words appear in them, with matches in a heading counting extra.
+    The best ones are kept in page order up to max_chars. Pages within the limit, or without "== Heading ==" markers,
+    are returned unchanged.
+
+    Args:
+        content (str): The page content from the wikipedia library
+        query (str): The query the page was fetched for
+        max_chars (int): The maximum number of characters to keep
+
+    Returns:
+        str: The selected content
+    """
+    if len(content) <= max_chars:
+        return content
+    starts = [match.start() for match in _WIKI_SECTION_RE.finditer(content)]
+    if not starts:
+        return content
+
+    bounds = [0, *starts, len(content)]
+    intro, *sections = [content[start:end] for start, end in zip(bounds, bounds[1:])]
+    terms = set(_WORD_RE.findall(query.lower()))
+
+    def score(section: str) -> int:
+        heading, _, body = section.partition("\n")
+        heading, body = heading.lower(), body.lower()
+        return sum(10 * heading.count(term) + body.count(term) for term in terms)
+
+    # Rank by score, keeping page order between equal scores
+    ranked = sorted(range(len(sections)), key=lambda i: score(sections[i]), reverse=True)
+    chosen, used = [], len(intro)
+    for i in ranked:
+        if used + len(sections[i]) <= max_chars:
+            chosen.append(i)
+            used += len(sections[i])
+    logger.info("Kept %d of %d Wikipedia sections (%d of %d characters)", len(chosen), len(sections), used, len(content))
+    return intro + "".join(sections[i] for i in sorted(chosen))
+
+
+# Session for the HTML fallback, so page downloads reuse pooled keep-alive connections (gzip is on by default).
+# Tools run on worker threads, so the pool keeps enough connections per host for concurrent questions.
+WIKI_HTTP_POOL_SIZE = 16
+_WIKI_SESSION = requests.Session()
+_WIKI_SESSION.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=WIKI_HTTP_POOL_SIZE))
+
+
+def fetch_wikipedia_content(query: str) -> Tuple[str, bool]:
+    """Fetch and render the full Wikipedia page for a query. Caching is left to lookup_wikipedia_content.
+
+    Args:
+        query (str): The search term or page title to look up on Wikipedia
+
+    Returns:
+        Tuple[str, bool]: The page metadata followed by the full page content, and whether the result is complete
+        enough to persist (False when no page was found or the HTML fallback failed)
+    """
+    # Try to get the page directly first
+    try:
+        page = wikipedia.page(query)
+        logger.info("Found page: %s", page.title)
+    except wikipedia.exceptions.DisambiguationError as e:
+        # If there are multiple pages with similar names, use the first option
+        page = wikipedia.page(e.options[0])
+        logger.info("Found page (disambiguation): %s", page.title)
+    except wikipedia.exceptions.PageError:
+        # If page doesn't exist, search for it
+        search_results = wikipedia.search(query, results=5)
+        if search_results:
+            page = wikipedia.page(search_results[0])
+            logger.info("Found page via search: %s", page.title)
+        else:
+            return f"No Wikipedia page found for '{query}'", False
+    
+    # Get the full page content from wikipedia library
+    full_content = page.content
+    
+    # Check if content seems incomplete (missing key sections)
+    query_lower = query.lower()
+    content_looks_complete = True
+    if len(full_content) < 10000:  # Very short content
+        content_looks_complete = False
+    elif "recipients" in query_lower and _RECIPIENTS_RE.search(full_content) is None:
+        content_looks_complete = False
+    elif "list" in query_lower and full_content.count('\n') < 49:
+        content_looks_complete = False
+    
+    # If content seems incomplete, parse the page HTML as fallback
+    fallback_failed = False
+    if not content_looks_complete:
+        logger.info("Content seems incomplete, trying HTML fallback...")
+        try:
+            import lxml.html
+            
+            # Get the raw HTML content
+            response = _WIKI_SESSION.get(page.url, timeout=30)
+            tree = lxml.html.fromstring(response.content)
+            
+            # Extract the main content
+            content_div = tree.get_element_by_id('mw-content-text', None)
+            if content_div is not None:
+                # Remove unwanted elements but keep tables and lists; drop_tree keeps the text that follows each element
+                for element in content_div.xpath('.//script | .//style | .//sup | .//comment()'):
+                    element.drop_tree()
+                
+                # Get text content with one stripped text fragment per line
+                raw_content = '\n'.join(text for text in (fragment.strip() for fragment in content_div.itertext()) if text)
+                
+                # If raw content is significantly longer, use it
+                if len(raw_content) > len(full_content) * 1.5:
+                    full_content = raw_content
+                    logger.info("Using HTML content for more complete data")
+                else:
+                    logger.info("HTML content not significantly better, keeping original")
+            else:
+                logger.warning("Could not find main content div in HTML")
+                fallback_failed = True
+        except Exception as e:
+            logger.warning("HTML fallback failed: %s", e)
+            fallback_failed = True
+    
+    # Cut very long pages down to the sections most relevant to the query
+    page_length = len(full_content)
+    full_content = select_relevant_sections(full_content, query)
+
+    # Add page metadata
+    page_info = f"Page Title: {page.title}\n"
+    page_info += f"URL: {page.url}\n"
+    page_info += f"Summary: {page.summary}\n"
+    page_info += f"Content Length: {len(full_content)} characters\n"
+    if len(full_content) < page_length:
+        page_info += f"Note: The page has {page_length} characters, so only the sections most relevant to the query are included\n"
+    page_info += f"Method: {'HTML Fallback' if not content_looks_complete else 'Wikipedia Library'}\n\n"
+    page_info += "=" * 50 + "\n"
+    page_info += "FULL PAGE CONTENT:\n"
+    page_info += "=" * 50 + "\n\n"
+    
+    logger.info("Successfully retrieved content from Wikipedia page: %s (%d characters)", page.title, len(full_content))
+    return page_info + full_content, not fallback_failed
+
+
+# Persistent cache of rendered Wikipedia pages, shared across runs (set WIKI_CACHE_DISABLE=1 to always fetch live pages)
+WIKI_CACHE_DISABLE = os.environ.get("WIKI_CACHE_DISABLE", "").lower() in ("1", "true", "yes")
+WIKI_CACHE_PATH = Path(os.environ.get("WIKI_CACHE_PATH", Path.home() / ".cache" / "wiki" / "wikipedia.sqlite3"))
+WIKI_CACHE_TTL = 24 * 60 * 60
+
+# Tools run on worker threads, so access to the shared connection is serialized
+_wiki_cache_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1)
+def get_wiki_cache() -> sqlite3.Connection:
+    """Open the persistent Wikipedia cache, creating it on first use.
+
+    Returns:
+        sqlite3.Connection: Connection to the cache database
+    """
+    WIKI_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(WIKI_CACHE_PATH, check_same_thread=False)
+    connection.execute("CREATE TABLE IF NOT EXISTS wiki_pages (query TEXT PRIMARY KEY, content TEXT NOT NULL, fetched_at REAL NOT NULL)")
+    connection.commit()
+    return connection
+
+
+def read_wiki_cache(key: str) -> Optional[str]:
+    """Read a fresh page from the persistent Wikipedia cache.
+
+    A cache that cannot be opened or read (unwritable directory, locked or corrupt database) is logged and treated
+    as a miss, so Wikipedia lookups keep working without it.
+
+    Args:
+        key (str): The cache key of the page
+
+    Returns:
+        Optional[str]: The cached page, or None if it is missing, stale or the cache is unavailable
+    """
+    try:
+        with _wiki_cache_lock:
+            row = get_wiki_cache().execute(
+                "SELECT content FROM wiki_pages WHERE query = ? AND fetched_at > ?", (key, time.time() - WIKI_CACHE_TTL)
+            ).fetchone()
+    except (OSError, sqlite3.Error) as e:
+        logger.warning("Wikipedia cache read failed: %s", e)
+        return None
+    return row[0] if row is not None else None
+
+
+def write_wiki_cache(key: str, content: str) -> None:
+    """Store a page in the persistent Wikipedia cache. A failed write is logged and otherwise ignored.
+
+    Args:
+        key (str): The cache key of the page
+        content (str): The rendered page
+    """
+    try:
+        with _wiki_cache_lock:
+            connection = get_wiki_cache()
+            connection.execute("INSERT OR REPLACE INTO wiki_pages VALUES (?, ?, ?)", (key, content, time.time()))
+            connection.commit()
+    except (OSError, sqlite3.Error) as e:
+        logger.warning("Wikipedia cache write failed: %s", e)
+
+
+@functools.lru_cache(maxsize=256)
+def lookup_wikipedia_content(key: str) -> str:
+    """Get the rendered Wikipedia page for a cache key, checking the persistent cache before fetching it.
+
+    Results are also kept in memory per key, so repeated lookups during a run skip the disk and the network.
+    Errors are raised rather than cached.
+
+    Args:
+        key (str): The stripped query
+
+    Returns:
+        str: The page metadata followed by the full page content
+    """
+    content = read_wiki_cache(key)
+    if content is not None:
+        logger.info("Wikipedia cache hit for: %s", key)
+        return content
+
+    content, persist = fetch_wikipedia_content(key)
+    # Not-found lookups and pages whose HTML fallback failed may succeed on a later run, so they are not persisted
+    if persist:
+        write_wiki_cache(key, content)
+    return content
+
+
+def get_wikipedia_content(query: str) -> str:
+    """Get the rendered Wikipedia page for a query, checking the in-memory and persistent caches first.
+
+    Args:
+        query (str): The search term or page title to look up on Wikipedia
+
+    Returns:
+        str: The page metadata followed by the full page content
+    """
+    if WIKI_CACHE_DISABLE:
+        return fetch_wikipedia_content(query)[0]
+
+    # Titles are case-sensitive after the first character ("Red Dwarf" vs "Red dwarf"), so only whitespace is stripped
+    return lookup_wikipedia_content(query.strip())
+
+
 @tool
 def wikipedia_tool(query: str) -> str:
     """
-    Search for and retrieve the full content of a Wikipedia page.
+    Search for and retrieve the content of a Wikipedia page.
     
     This tool will:
     1. Search for the Wikipedia page matching your query
-    2. Retrieve the complete page content (not just a summary)
-    3. Return the full text including all sections and subsections
-    4. Use Beautiful Soup as fallback if content is missing
+    2. Retrieve the page content (not just a summary)
+    3. Return the full text including all sections and subsections, unless the page is very long: then only the
+       introduction and the sections most relevant to your query are kept, and a Note in the header gives the
+       full page length. A trimmed page is not the whole article; query again with more specific words if a
+       section you need is missing.
+    4. Parse the page HTML as fallback if content is missing
     
     Args:
         query: The search term or page title to look up on Wikipedia
         
     Returns:
-        The complete Wikipedia page content as a string
+        The Wikipedia page content as a string, trimmed to the most relevant sections for long pages
     """
-    logger.info(f"Wikipedia tool searching for: {query}")
+    logger.info("Wikipedia tool searching for: %s", query)
     
     try:
-        import wikipedia
-        
-        # Set the language to English
-        wikipedia.set_lang("en")
-        
-        # Try to get the page directly first
-        try:
-            page = wikipedia.page(query)
-            logger.info(f"Found page: {page.title}")
-        except wikipedia.exceptions.DisambiguationError as e:
-            # If there are multiple pages with similar names, use the first option
-            page = wikipedia.page(e.options[0])
-            logger.info(f"Found page (disambiguation): {page.title}")
-        except wikipedia.exceptions.PageError:
-            # If page doesn't exist, search for it
-            search_results = wikipedia.search(query, results=5)
-            if search_results:
-                page = wikipedia.page(search_results[0])
-                logger.info(f"Found page via search: {page.title}")
-            else:
-                return f"No Wikipedia page found for '{query}'"
-        
-        # Get the full page content from wikipedia library
-        full_content = page.content
-        
-        # Check if content seems incomplete (missing key sections)
-        content_looks_complete = True
-        if len(full_content) < 10000:  # Very short content
-            content_looks_complete = False
-        elif "recipients" in query.lower() and "recipients" not in full_content.lower():
-            content_looks_complete = False
-        elif "list" in query.lower() and len(full_content.split('\n')) < 50:
-            content_looks_complete = False
-        
-        # If content seems incomplete, try Beautiful Soup as fallback
-        if not content_looks_complete:
-            logger.info("Content seems incomplete, trying Beautiful Soup fallback...")
-            try:
-                import requests
-                from bs4 import BeautifulSoup
-                
-                # Get the raw HTML content
-                response = requests.get(page.url)
-                soup = BeautifulSoup(response.content, 'html.parser')
-                
-                # Extract the main content
-                content_div = soup.find('div', {'id': 'mw-content-text'})
-                if content_div:
-                    # Remove unwanted elements but keep tables and lists
-                    for element in content_div.find_all(['script', 'style', 'sup']):
-                        element.decompose()
-                    
-                    # Get text content with better formatting
-                    raw_content = content_div.get_text(separator='\n', strip=True)
-                    
-                    # If raw content is significantly longer, use it
-                    if len(raw_content) > len(full_content) * 1.5:
-                        full_content = raw_content
-                        logger.info("Using Beautiful Soup content for more complete data")
-                    else:
-                        logger.info("Beautiful Soup content not significantly better, keeping original")
-                else:
-                    logger.warning("Could not find main content div in HTML")
-            except Exception as e:
-                logger.warning(f"Beautiful Soup fallback failed: {e}")
-        
-        # Add page metadata
-        page_info = f"Page Title: {page.title}\n"
-        page_info += f"URL: {page.url}\n"
-        page_info += f"Summary: {page.summary}\n"
-        page_info += f"Content Length: {len(full_content)} characters\n"
-        page_info += f"Method: {'Beautiful Soup' if not content_looks_complete else 'Wikipedia Library'}\n\n"
-        page_info += "=" * 50 + "\n"
-        page_info += "FULL PAGE CONTENT:\n"
-        page_info += "=" * 50 + "\n\n"
-        
-        logger.info(f"Successfully retrieved content from Wikipedia page: {page.title} ({len(full_content)} characters)")
-        return page_info + full_content
-        
+        return get_wikipedia_content(query)
     except Exception as e:
-        logger.error(f"Error retrieving Wikipedia content: {e}")
+        logger.error("Error retrieving Wikipedia content: %s", e)
         return f"Error retrieving Wikipedia content: {str(e)}"
 
 
+@functools.lru_cache(maxsize=1)
+def get_tavily_search() -> TavilySearch:
+    """Get the shared TavilySearch instance.
+
+    It is created on first use rather than at import, because construction requires TAVILY_API_KEY.
+
+    Returns:
+        TavilySearch: The TavilySearch instance reused by every tavily_tool call
+    """
+    return TavilySearch()
+
+
+# Number of distinct Tavily searches whose results are kept
+TAVILY_CACHE_SIZE = 256
+_tavily_results: dict[str, dict] = {}
+
+
+def normalize_search_query(query: str) -> str:
+    """Normalize a search query, so queries that differ only in case or whitespace share a cache entry.
+
+    Args:
+        query (str): The search query
+
+    Returns:
+        str: The lowercased query with runs of whitespace collapsed to single spaces
+    """
+    return " ".join(query.lower().split())
+
+
+def search_tavily(query: str) -> dict:
+    """Run a Tavily web search, caching the results per normalized query.
+
+    Args:
+        query (str): The search query
+
+    Returns:
+        dict: The Tavily search results
+    """
+    key = normalize_search_query(query)
+    results = _tavily_results.get(key)
+    if results is None:
+        results = get_tavily_search().invoke(query)
+        remember_result(_tavily_results, key, results, TAVILY_CACHE_SIZE)
+    else:
+        logger.info("Tavily cache hit for: %s", query)
+    return results
+
+
 @tool
 def tavily_tool(query: str) -> str:
     """
     Search for information on the web.
     """
-    logger.info(f"Tavily tool searching for: {query}")
-    tavily_tool = TavilySearch()
-    return tavily_tool.invoke(query)
+    logger.info("Tavily tool searching for: %s", query)
+    # Serialize here with orjson, otherwise ToolNode falls back to json.dumps for the dict
+    return orjson.dumps(search_tavily(query)).decode()
+
+
+_YOUTUBE_ID_RE = re.compile(r"(?:[?&]v=|youtu\.be/|/shorts/|/embed/|/live/)([\w-]{11})")
+
+
+def normalize_youtube_url(url: str) -> str:
+    """Rewrite a YouTube URL to its canonical watch URL, so every form of a link to the same video shares one cache entry.
+
+    Args:
+        url (str): A YouTube video URL, e.g. a youtu.be link or a watch URL with extra parameters
+
+    Returns:
+        str: https://www.youtube.com/watch?v=<id>, or the stripped URL if no video id is found
+    """
+    match = _YOUTUBE_ID_RE.search(url)
+    if match is None:
+        return url.strip()
+    return f"https://www.youtube.com/watch?v={match.group(1)}"
+
+
+@functools.lru_cache(maxsize=128)
+def fetch_youtube_documents(url: str) -> tuple[Document, ...]:
+    """Fetch the transcript and video info of a YouTube video, caching the result per URL.
+
+    Args:
+        url (str): The YouTube video URL
+
+    Returns:
+        tuple[Document, ...]: The transcript documents
+    """
+    from langchain_community.document_loaders import YoutubeLoader
+    return tuple(YoutubeLoader.from_youtube_url(url, add_video_info=True).load())
 
 
 @tool
@@ -180,11 +476,10 @@ def youtube_transcript_tool(url: str) -> str:
     Returns:
         The transcript text from the video
     """
-    logger.info(f"YouTube transcript tool processing URL: {url}")
+    logger.info("YouTube transcript tool processing URL: %s", url)
     
     # Load the YouTube video transcript
-    loader = YoutubeLoader.from_youtube_url(url, add_video_info=True)
-    documents = loader.load()
+    documents = fetch_youtube_documents(normalize_youtube_url(url))
     
     if not documents:
         logger.info("No transcript found for YouTube video")
@@ -199,26 +494,56 @@ def youtube_transcript_tool(url: str) -> str:
     video_info += f"Channel: {metadata.get('author', 'Unknown')}\n"
     video_info += f"Duration: {metadata.get('length', 'Unknown')} seconds\n\n"
     
-    logger.info(f"YouTube transcript tool completed successfully")
+    logger.info("YouTube transcript tool completed successfully")
     return video_info + transcript
 
+@functools.lru_cache(maxsize=64)
+def _load_documents(loader_cls: type, file_path: str, mtime_ns: int) -> tuple[Document, ...]:
+    """Load a file with the given document loader, caching the documents.
+
+    The file's modification time is part of the cache key, so an edited file is loaded again.
+
+    Args:
+        loader_cls (type): The document loader class to use
+        file_path (str): The path of the file to load
+        mtime_ns (int): The file's modification time in nanoseconds
+
+    Returns:
+        tuple[Document, ...]: The loaded documents
+    """
+    return tuple(loader_cls(file_path).load())
+
+
+def load_documents(loader_cls: type, file_path: str) -> list[Document]:
+    """Load a file with the given document loader, reusing the cached documents if the file is unchanged.
+
+    Args:
+        loader_cls (type): The document loader class to use
+        file_path (str): The path of the file to load
+
+    Returns:
+        list[Document]: The loaded documents
+    """
+    return list(_load_documents(loader_cls, file_path, os.stat(file_path).st_mtime_ns))
+
+
 @tool
 def unstructured_excel_tool(file_path: str) -> list[Document]:
     """
     Load an Excel file and return the content.
     """
-    logger.info(f"Loading Excel file: {file_path}")
-    loader = UnstructuredExcelLoader(file_path)
-    return loader.load()
+    logger.info("Loading Excel file: %s", file_path)
+    from langchain_community.document_loaders import UnstructuredExcelLoader
+    return load_documents(UnstructuredExcelLoader, file_path)
 
 @tool
 def unstructured_powerpoint_tool(file_path: str) -> list[Document]:
     """
     Load a PowerPoint file and return the content.
     """
-    logger.info(f"Loading PowerPoint file: {file_path}")
-    loader = UnstructuredPowerPointLoader(file_path)
-    return loader.load()
+    logger.info("Loading PowerPoint file: %s", file_path)
+    from langchain_community.document_loaders import UnstructuredPowerPointLoader
+    return load_documents(UnstructuredPowerPointLoader, file_path)
 
 
 @tool
@@ -226,9 +551,9 @@ def unstructured_pdf_tool(file_path: str) -> list[Document]:
     """
     Load a PDF file and return the content.
     """
-    logger.info(f"Loading PDF file: {file_path}")
-    loader = UnstructuredPDFLoader(file_path)
-    return loader.load()
+    logger.info("Loading PDF file: %s", file_path)
+    from langchain_community.document_loaders import UnstructuredPDFLoader
+    return load_documents(UnstructuredPDFLoader, file_path)
 
 
 @tool
@@ -236,9 +561,9 @@ def text_file_tool(file_path: str) -> str:
     """
     Load a text file and return the content.
     """
-    logger.info(f"Loading text file: {file_path}")
-    loader = TextLoader(file_path)
-    documents = loader.load()
+    logger.info("Loading text file: %s", file_path)
+    from langchain_community.document_loaders import TextLoader
+    documents = load_documents(TextLoader, file_path)
     if documents:
         return documents[0].page_content
     else:
@@ -248,6 +573,33 @@ def text_file_tool(file_path: str) -> str:
 ########################################################
 # < Information Synthesis Tools >
 ########################################################
+@functools.lru_cache(maxsize=1)
+def get_unit_registry():
+    """Get the shared pint UnitRegistry, importing pint and building the registry on first use.
+
+    Building a UnitRegistry parses pint's default units file, so a single one is shared by every conversion.
+
+    Returns:
+        pint.UnitRegistry: The shared unit registry
+    """
+    import pint
+    return pint.UnitRegistry()
+
+
+@functools.lru_cache(maxsize=256)
+def convert_units(quantity: str, to_unit: str) -> str:
+    """Convert a quantity to a different unit, caching the result per (quantity, to_unit).
+
+    Args:
+        quantity (str): A string like '10 meters', '5 kg', '32 fahrenheit'
+        to_unit (str): The unit to convert to, e.g. 'ft', 'lbs', 'celsius'
+
+    Returns:
+        str: The converted value
+    """
+    return str(get_unit_registry()(quantity).to(to_unit))
+
+
 @tool
 def unit_converter(quantity: str, to_unit: str) -> str:
     """
@@ -258,12 +610,44 @@ def unit_converter(quantity: str, to_unit: str) -> str:
     Returns:
         The converted value as a string.
     """
-    logger.info(f"Unit converter converting {quantity} to {to_unit}")
-    ureg = pint.UnitRegistry()
-    q = ureg(quantity)
-    result = q.to(to_unit)
-    logger.info(f"Unit converter result: {result}")
-    return str(result)
+    logger.info("Unit converter converting %s to %s", quantity, to_unit)
+    result = convert_units(quantity, to_unit)
+    logger.info("Unit converter result: %s", result)
+    return result
+
+
+# Names the calculator may use: everything in math, and no builtins
+_CALC_NAMES = {k: v for k, v in math.__dict__.items() if not k.startswith("__")}
+_CALC_NAMES["__builtins__"] = None
+
+
+# Syntax a calculator expression may use: arithmetic on numbers, math names, calls to math functions and
+# list or tuple literals for functions that take a sequence (fsum, prod, dist)
+_CALC_ALLOWED_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.operator, ast.unaryop, ast.Constant, ast.Name, ast.Load, ast.Call, ast.List, ast.Tuple)
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_expression(expression: str):
+    """Validate and compile a calculator expression, caching the code object so repeated expressions skip the compiler.
+
+    Args:
+        expression (str): The math expression to compile
+
+    Returns:
+        The compiled code object
+
+    Raises:
+        ValueError: If the expression uses syntax or names the calculator does not allow
+    """
+    tree = ast.parse(expression, mode="eval")
+    for node in ast.walk(tree):
+        if not isinstance(node, _CALC_ALLOWED_NODES):
+            raise ValueError(f"Unsupported syntax in expression: {type(node).__name__}")
+        if isinstance(node, ast.Name) and (node.id.startswith("_") or node.id not in _CALC_NAMES):
+            raise ValueError(f"Unknown name in expression: {node.id}")
+        if isinstance(node, ast.Constant) and (isinstance(node.value, bool) or not isinstance(node.value, (int, float, complex))):
+            raise ValueError(f"Unsupported constant in expression: {node.value!r}")
+    return compile(tree, "<calc>", "eval")
 
 
 @tool
@@ -276,18 +660,57 @@ def calculator(expression: str) -> str:
     Returns:
         str: The result of the expression
     """
-    logger.info(f"Calculator evaluating expression: {expression}")
-    import math
-    allowed_names = {
-        k: v for k, v in math.__dict__.items() if not k.startswith("__")
-    }
-    result = eval(expression, {"__builtins__": None}, allowed_names)
-    logger.info(f"Calculator result: {result}")
+    logger.info("Calculator evaluating expression: %s", expression)
+    result = eval(compile_expression(expression), _CALC_NAMES)
+    logger.info("Calculator result: %s", result)
     return str(result)
 
 
+# One REPL per question (keyed by the run's thread_id), so imports and definitions carry over between calls of the same
+# question but never leak into another question. Runners release a question's REPL when its run ends; the bound only
+# matters for callers that don't, and is kept well above the number of questions running at once
+PYTHON_REPL_CACHE_SIZE = max(32, 4 * int(os.environ.get("GAIA_MAX_CONCURRENCY", "8")))
+_python_repls: dict[str, Any] = {}
+
+# PythonREPL swaps the process-wide sys.stdout while code runs, so only one call may execute at a time
+_python_repl_lock = threading.Lock()
+
+# Seconds a call waits for another question's code to finish before giving up, so a runaway loop in one question
+# cannot block the REPL (and the worker threads waiting on it) for every other question
+PYTHON_REPL_LOCK_TIMEOUT = 60
+
+
+def get_python_repl(thread_id: Optional[str]):
+    """Get the PythonREPLTool for a question, creating it on first use.
+
+    Args:
+        thread_id (str): The thread_id of the question's run. Without one, a fresh REPL is returned for this call only.
+
+    Returns:
+        PythonREPLTool: The question's Python REPL tool
+    """
+    from langchain_experimental.tools.python.tool import PythonREPLTool
+    if thread_id is None:
+        return PythonREPLTool()
+    repl = _python_repls.get(thread_id)
+    if repl is None:
+        repl = PythonREPLTool()
+        remember_result(_python_repls, thread_id, repl, PYTHON_REPL_CACHE_SIZE)
+    return repl
+
+
+def release_python_repl(thread_id: str) -> None:
+    """Drop a question's Python REPL once its run has ended, freeing its namespace and any data it holds.
+
+    Args:
+        thread_id (str): The thread_id of the finished run
+    """
+    with _result_cache_lock:
+        _python_repls.pop(thread_id, None)
+
+
 @tool
-def python_repl_tool(code: str) -> str:
+def python_repl_tool(code: str, config: RunnableConfig) -> str:
     """
     Use this when you need to run Python code.
     
@@ -307,19 +730,44 @@ def python_repl_tool(code: str) -> str:
     Returns:
         The result of the code execution as a string.
     """
-    logger.info(f"Executing the following python code: {code}")
-    python_repl_tool = PythonREPLTool()
-    return python_repl_tool.invoke(code)
+    logger.info("Executing the following python code: %s", code)
+    thread_id = config.get("configurable", {}).get("thread_id")
+    if not _python_repl_lock.acquire(timeout=PYTHON_REPL_LOCK_TIMEOUT):
+        logger.warning("Python REPL busy for more than %s seconds, giving up", PYTHON_REPL_LOCK_TIMEOUT)
+        return f"Error: the Python REPL was busy running other code for more than {PYTHON_REPL_LOCK_TIMEOUT} seconds. Try again, or continue without running code."
+    try:
+        return get_python_repl(thread_id).invoke(code)
+    finally:
+        _python_repl_lock.release()
 
 
 ########################################################
 # < Guard Agent as a Tool >
 ########################################################
-def create_guard_agent_tool(config: AgentConfig) -> Callable[[str], str]:
-    """Create a guard agent function with the given prompts for different critic types."""
+# Number of distinct guard consults whose replies are kept per guard tool
+GUARD_CACHE_SIZE = 256
+
+
+def create_guard_agent_tool(config: AgentConfig) -> StructuredTool:
+    """Create a guard agent tool with the given prompts for different critic types.
+
+    The tool has both a sync and an async implementation, so the LLM call does not block the event loop when the
+    graph is run with ainvoke.
+    """
     llm_guard = llm_factory(config)
+    # The system prompt is the same on every consult, so build it once
+    sys_prompt = SystemMessage(content=config.system_prompt)
+
+    # Guard replies keyed by a hash of the guard input, so an identical consult is answered without the LLM
+    guard_responses: dict[bytes, str] = {}
+
+    def build_guard_message(question_for_guard: str, original_task: str, context: str) -> str:
+        return f"""## Original Task\n{original_task}\n\n## Context\n{context}\n\n## Question for Guard\n{question_for_guard}"""
+
+    def guard_cache_key(message_in: str) -> bytes:
+        # Keyed on the exact input: case and layout in the context can change the guard's verdict
+        return hashlib.blake2b(message_in.encode(), digest_size=16).digest()
 
-    @tool
     def guard_agent_tool(question_for_guard:str, original_task:str, context:str) -> str:
         """Use this tool when you need to review your thinking process or you need to review your final answer and reasoning to seek key suggestions proactively or in review.
         
@@ -331,22 +779,44 @@ def create_guard_agent_tool(config: AgentConfig) -> Callable[[str], str]:
         Returns:
             The response from the guard agent
         """
-        logger.info(f"Guard starting execution")
-        
-        sys_prompt = [SystemMessage(content=config.system_prompt)]
-        message_in = f"""## Original Task\n{original_task}\n\n## Context\n{context}\n\n## Question for Guard\n{question_for_guard}"""
+        logger.info("Guard starting execution")
+        message_in = build_guard_message(question_for_guard, original_task, context)
+        key = guard_cache_key(message_in)
+        cached_response = guard_responses.get(key)
+        if cached_response is not None:
+            logger.info("Guard reusing cached response")
+            return cached_response
+
+        response = llm_guard.invoke([sys_prompt, HumanMessage(content=message_in)])
+        remember_result(guard_responses, key, response.content, GUARD_CACHE_SIZE)
+        logger.info("Guard completed successfully")
+        return response.content
 
-        response = llm_guard.invoke(sys_prompt + [HumanMessage(content=message_in)])     
-        
+    async def aguard_agent_tool(question_for_guard:str, original_task:str, context:str) -> str:
+        logger.info("Guard starting execution")
+        message_in = build_guard_message(question_for_guard, original_task, context)
+        key = guard_cache_key(message_in)
+        cached_response = guard_responses.get(key)
+        if cached_response is not None:
+            logger.info("Guard reusing cached response")
+            return cached_response
+
+        response = await llm_guard.ainvoke([sys_prompt, HumanMessage(content=message_in)])
+        remember_result(guard_responses, key, response.content, GUARD_CACHE_SIZE)
         logger.info("Guard completed successfully")
         return response.content
-    
-    return guard_agent_tool
+
+    return StructuredTool.from_function(func=guard_agent_tool, coroutine=aguard_agent_tool)
 
 ########################################################
 # < Main Graph Nodes >
 ########################################################
 
+# Templates for the task message that starts the executor's conversation
+TASK_TEMPLATE = "## Task\n{question}"
+TASK_WITH_FILE_TEMPLATE = "## Task\n{question}\n\n## File\nUse the following file to help you solve the task: {file}"
+
+
 def input_interface(state: GraphState) -> GraphState:
     """Input interface with error handling and validation."""
     logger.info("Input interface starting execution")
@@ -355,66 +825,100 @@ def input_interface(state: GraphState) -> GraphState:
     if not state.get("question") or len(state["question"]) == 0:
         raise ValueError("No question provided to input interface")
 
-    # Initialize all state fields first to ensure they exist for error handling
-    state["file"] = state["file"] if state["file"] else None
+    # Normalize an empty file reference to None
+    file = state.get("file") or None
 
-    if state["file"]:
-        state["messages"] = [HumanMessage(content=f"## Task\n{state['question']}\n\n## File\nUse the following file to help you solve the task: {state['file']}")]
+    if file:
+        message = HumanMessage(content=TASK_WITH_FILE_TEMPLATE.format(question=state["question"], file=file))
     else:
-        state["messages"] = [HumanMessage(content=f"## Task\n{state['question']}")]
+        message = HumanMessage(content=TASK_TEMPLATE.format(question=state["question"]))
         
     logger.info("Input interface completed successfully")
-    return state
+    return {"file": file, "messages": [message]}
+
 
+def create_executor_agent(config: AgentConfig, llm_executor: ChatOpenAI) -> RunnableLambda:
+    """Create an executor agent node with the given prompt and LLM.
+
+    The node has both a sync and an async implementation, so graph.ainvoke awaits the LLM call directly instead of
+    running it in a worker thread.
+    """
+    # The system prompt is the same on every turn, so build it once
+    sys_prompt = SystemMessage(content=config.system_prompt)
+
+    def log_tool_calls(response: AIMessage) -> None:
+        # If the Executor has tool calls, it is still working on the task
+        if hasattr(response, 'tool_calls') and response.tool_calls:
+            logger.info("Executor tool calls: %s", response.tool_calls)
 
-def create_executor_agent(config: AgentConfig, llm_executor: ChatOpenAI) -> Callable[[GraphState], GraphState]:
-    """Create an executor agent function with the given prompt and LLM."""
     def executor_agent(state: GraphState) -> GraphState:
         """Executor agent with injected prompt."""
         logger.info("Executor starting execution")
-        
-        sys_prompt = [SystemMessage(content=config.system_prompt)]
-        response = llm_executor.invoke(sys_prompt + state["messages"])
+        response = llm_executor.invoke([sys_prompt, *state["messages"]])
+        log_tool_calls(response)
+        return {"messages": [response]}
 
-        # If the Executor has tool calls, it is still working on the task
-        if hasattr(response, 'tool_calls') and response.tool_calls:
-            logger.info(f"Executor tool calls: {response.tool_calls}")
+    async def aexecutor_agent(state: GraphState) -> GraphState:
+        """Async executor agent with injected prompt."""
+        logger.info("Executor starting execution")
+        response = await llm_executor.ainvoke([sys_prompt, *state["messages"]])
+        log_tool_calls(response)
         return {"messages": [response]}
     
-    return executor_agent
+    return RunnableLambda(executor_agent, afunc=aexecutor_agent, name="executor")
 
 
 
 ########################################################
 # < Graph Factory Function >
 ########################################################
-def openai_llm_factory(model: str, temperature: float, tools: list = None) -> ChatOpenAI:
+# Sync HTTP client shared by every ChatOpenAI instance, so all agents draw from one connection pool. It keeps the
+# OpenAI SDK's client defaults (timeouts, redirects). There is no shared async client: its connections would be tied
+# to the first event loop that used them, so async callers inject their own (see AgentConfig.http_async_client)
+_SHARED_HTTP_CLIENT = DefaultHttpxClient(limits=httpx.Limits(max_connections=64, max_keepalive_connections=32))
+atexit.register(_SHARED_HTTP_CLIENT.close)
+
+
+def openai_llm_factory(model: str, temperature: float, tools: list = None, http_async_client: httpx.AsyncClient = None) -> ChatOpenAI:
     """Create an OpenAI LLM with the given model and temperature.
 
     Args:
         model (str): The model to use
         temperature (float): The temperature to use
-        output_schema (dict): The output schema to use (JSON schema)
+        tools (list): The tools to bind to the LLM
+        http_async_client (httpx.AsyncClient): Optional async HTTP client, e.g. one sized for the caller's concurrency. When None, the OpenAI SDK creates its own.
     """
-    llm = ChatOpenAI(model=model, temperature=temperature)
+    llm = ChatOpenAI(
+        model=model,
+        temperature=temperature,
+        http_client=_SHARED_HTTP_CLIENT,
+        http_async_client=http_async_client,
+    )
     if tools:
         llm = llm.bind_tools(tools)
     return llm
 
 
+# LLM factory for each supported provider
+LLM_FACTORIES: dict[str, Callable[..., ChatOpenAI]] = {
+    "openai": openai_llm_factory,
+}
+
+
 def llm_factory(config:AgentConfig, tools: list = None) -> ChatOpenAI:
     """Get the appropriate LLM factory based on the provider.
 
     Args:
         config (AgentConfig): The configuration for the agent
+        tools (list): The tools to bind to the LLM
 
     Returns:
         ChatOpenAI: The LLM with structured output
     """
-    if config.provider == "openai":
-        return openai_llm_factory(config.model, config.temperature, tools)
-    else:
+    provider_factory = LLM_FACTORIES.get(config.provider)
+    if provider_factory is None:
         raise ValueError(f"Invalid provider: {config.provider}")
+    return provider_factory(config.model, config.temperature, tools, config.http_async_client)
 
 
 def assemble_tools(agent_configs: dict[str, AgentConfig]) -> list:
@@ -422,15 +926,16 @@ def assemble_tools(agent_configs: dict[str, AgentConfig]) -> list:
     return [guard_agent_tool, youtube_transcript_tool, tavily_tool, wikipedia_tool, unstructured_excel_tool, unstructured_powerpoint_tool, unstructured_pdf_tool, text_file_tool, unit_converter, calculator, python_repl_tool]
 
 
-def create_multi_agent_graph(agent_configs: dict[str, AgentConfig]) -> Tuple[StateGraph, OpikTracer]:
+def create_multi_agent_graph(agent_configs: dict[str, AgentConfig], enable_tracing: bool = True) -> Tuple[StateGraph, Optional["OpikTracer"]]:
     """
     Factory function that creates and compiles a multi-agent graph with injected prompts.
     
     Args:
         agent_configs (dict[str, AgentConfig]): Dictionary containing all agent configs
+        enable_tracing (bool): Whether to create an OpikTracer for the graph. When False, Opik is not imported.
         
     Returns:
-        Compiled graph ready for invocation
+        Compiled graph ready for invocation and its OpikTracer (None when tracing is disabled)
     """
     # Define Agent Tools
     tools = assemble_tools(agent_configs)
@@ -455,7 +960,11 @@ def create_multi_agent_graph(agent_configs: dict[str, AgentConfig]) -> Tuple[Sta
     # Compile and return the graph
     app = builder.compile()
 
+    if not enable_tracing:
+        return app, None
+
     # Create the OpikTracer for LangGraph
-    opik_tracer = OpikTracer(graph=app.get_graph(xray=True))
+    from opik.integrations.langchain import OpikTracer
+    opik_tracer = OpikTracer(graph=app.get_graph(xray=OPIK_XRAY))
     
     return app, opik_tracer
\ No newline at end of file